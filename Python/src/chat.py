@@ -171,13 +171,19 @@ async def search_employee_handbook(query):
         # Create a fresh instance of the search plugin for each query
         search_plugin = ContosoSearchPlugin()
         
+        # The plugin uses blocking HTTP calls, so run it in a worker thread
+        # to keep the event loop free for other requests
         # First try with the extracted topic
-        result = search_plugin.query_handbook(search_topic, top=3)
+        result = await asyncio.to_thread(
+            search_plugin.query_handbook, search_topic, top=3, question=query
+        )
         
         # If no results were found, try with the original query
         if "No relevant information found" in result and search_topic != query:
             logger.info(f"No results found with topic, trying with original query: {query}")
-            result = search_plugin.query_handbook(query, top=3)
+            result = await asyncio.to_thread(
+                search_plugin.query_handbook, query, top=3, question=query
+            )
         
         logger.info(f"Final result length: {len(result)}")
         logger.info(f"=== Completed Fresh Contoso Query ===")
@@ -1,267 +1,632 @@
-import json
 import os
-from typing import Dict, List, Any, Optional
+import re
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, FrozenSet, Iterator, List, Any, Optional, Pattern
 
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
 from dotenv import load_dotenv
 
+# Read the environment once at import instead of on every plugin construction.
+# override=True matches chat.py, which loads .env over the shell environment;
+# this module is imported before chat.py's own load_dotenv call runs.
+load_dotenv(override=True)
+_CFG = SimpleNamespace(
+    openai_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+    embedding_deployment=os.getenv("AZURE_OPENAI_EMBED_DEPLOYMENT_NAME"),
+    embedding_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2023-05-15"),
+    # Get embedding endpoint from environment variable
+    embedding_endpoint=os.getenv("AZURE_OPENAI_EMBED_ENDPOINT", os.getenv("AZURE_OPENAI_ENDPOINT")),
+    search_endpoint=os.getenv("AI_SEARCH_URL"),
+    search_key=os.getenv("AI_SEARCH_KEY"),
+    search_index_name=os.getenv("AZURE_SEARCH_INDEX", "employeehandbook"),
+    # Chat completion endpoint for rephrasing
+    chat_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    chat_deployment=os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
+    chat_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2023-12-01-preview")
+)
+
+
+@lru_cache(maxsize=None)
+def _get_session(key: str) -> requests.Session:
+    """Return a pooled Azure OpenAI session, shared by all plugin instances using the same key"""
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False
+    )
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Content-Type": "application/json",
+        "api-key": key
+    })
+    return session
+
+
+@lru_cache(maxsize=8)
+def _get_search_client(endpoint: str, index_name: str, key: str) -> SearchClient:
+    """
+    Return a SearchClient shared by all plugin instances querying the same index,
+    so its transport keeps connections to the Search endpoint warm.
+
+    The client is cached for the life of the process and must not be closed
+    (e.g. with `with plugin.search_client:`), since that would close it for
+    every instance. Pass your own client to ContosoSearchPlugin to manage its lifetime.
+    """
+    return SearchClient(
+        endpoint=endpoint,
+        index_name=index_name,
+        credential=AzureKeyCredential(key)
+    )
+
+
+# Sentence filters used to narrow handbook chunks down to the parts that answer the query
+SECURITY_RE = re.compile(r"password|encryption|access|confidential|protect|secure|data handling|classification", re.IGNORECASE)
+VACATION_RE = re.compile(r"days|hours|request|approval|accrual|balance|holiday", re.IGNORECASE)
+
+# Splits after sentence-ending punctuation followed by whitespace, so decimals
+# ("1.5 days") and dotted names ("contoso.com") are not broken apart
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+WORD_RE = re.compile(r"\w+")
+
+# Index fields read from search results; @search.score is always returned
+SEARCH_RESULT_FIELDS = ["chunk_id", "content", "title", "url", "filepath", "parent_id"]
+
+SECURITY_FILTER = "search.ismatch('security OR data OR confidential OR privacy', 'content')"
+VACATION_FILTER = "search.ismatch('vacation OR pto OR leave OR time off', 'content')"
+POLICY_FILTER = "search.ismatch('policy OR guideline OR procedure', 'content')"
+
+
+@dataclass(frozen=True)
+class Category:
+    """A handbook topic and how queries about it are searched and answered"""
+    name: str
+    # Query words or phrases that select this category, matched against _query_terms
+    trigger_kws: FrozenSet[str]
+    search_filter: Optional[str] = None
+    # None falls back to the generic header naming the query
+    response_header: Optional[str] = None
+    # Sentence filter applied to each result's content
+    extract_pattern: Optional[Pattern[str]] = None
+
+
+# Checked in order; the search filter, response header and sentence filter each
+# come from the first category matching the query that defines one
+CATEGORIES = (
+    Category(
+        "security",
+        frozenset({'data security', 'security policy', 'information security'}),
+        SECURITY_FILTER,
+        "**Contoso Data Security Policy Information:**\n\n",
+        SECURITY_RE
+    ),
+    # Broader security terms only narrow the search, so e.g. "health data privacy"
+    # keeps the benefits header
+    Category(
+        "data",
+        frozenset({'security', 'data'}),
+        SECURITY_FILTER
+    ),
+    Category(
+        "vacation",
+        frozenset({'vacation', 'pto', 'time off', 'leave'}),
+        VACATION_FILTER,
+        "**Contoso Vacation and Time Off Policy:**\n\n",
+        VACATION_RE
+    ),
+    Category(
+        "confidentiality",
+        frozenset({'confidential', 'confidentiality'}),
+        response_header="**Contoso Confidentiality Guidelines:**\n\n"
+    ),
+    Category(
+        "remote",
+        frozenset({'remote work', 'work from home', 'telework'}),
+        response_header="**Contoso Remote Work Policy:**\n\n"
+    ),
+    Category(
+        "benefits",
+        frozenset({'benefits', 'health', 'insurance'}),
+        response_header="**Contoso Employee Benefits:**\n\n"
+    ),
+    Category(
+        "policy",
+        frozenset({'policy'}),
+        POLICY_FILTER
+    )
+)
+GENERAL_CATEGORY = Category("general", frozenset())
+
+
+def _query_terms(query: str) -> FrozenSet[str]:
+    """
+    Lowercased words of the query plus its two- and three-word runs, so both
+    single words and phrases like 'time off' match a keyword set by intersection
+    """
+    words = WORD_RE.findall(query.lower())
+    return frozenset(
+        " ".join(words[i:i + n])
+        for n in (1, 2, 3)
+        for i in range(len(words) - n + 1)
+    )
+
+
+def _classify(query: str) -> Category:
+    """
+    Resolve the query's category in one pass over CATEGORIES, or GENERAL_CATEGORY.
+    When several categories match, each attribute is taken from the first one
+    defining it: "remote work policy" gets the remote work header and the policy
+    search filter. The result is named after the categories it was built from.
+    """
+    query_terms = _query_terms(query)
+    matches = [category for category in CATEGORIES if category.trigger_kws & query_terms]
+    if len(matches) <= 1:
+        return matches[0] if matches else GENERAL_CATEGORY
+
+    header = next((c for c in matches if c.response_header is not None), None)
+    extract = next((c for c in matches if c.extract_pattern is not None), None)
+    search = next((c for c in matches if c.search_filter is not None), None)
+    sources = [c for c in (header, extract, search) if c is not None]
+    return Category(
+        "+".join(dict.fromkeys(c.name for c in sources)),
+        frozenset().union(*(c.trigger_kws for c in sources)),
+        search.search_filter if search else None,
+        header.response_header if header else None,
+        extract.extract_pattern if extract else None
+    )
+
+
+# Retrieved content shorter than this that already reads as complete sentences
+# is returned as-is instead of being rephrased by the chat model
+FAST_PATH_MAX_CHARS = 800
+# Query words asking for an explanation, which raw handbook text does not give
+REPHRASE_KW = frozenset({'how', 'why', 'explain', 'compare', 'difference', 'summarize', 'summary', 'steps'})
+# Cache key suffix for answers returned without going through the chat model
+RAW_ANSWER_SUFFIX = ":raw"
+
+
+def _needs_rephrase(query: str) -> bool:
+    """Whether the question asks for an explanation rather than the handbook's own wording"""
+    return bool(REPHRASE_KW & _query_terms(query))
+
+
+# Azure OpenAI accepts at most 16 inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 16
+
+
+def _request_embeddings(texts: List[str], endpoint: str, deployment: str, key: str, version: str) -> np.ndarray:
+    """Embed up to EMBEDDING_BATCH_SIZE texts in a single request, one unit-length float32 row per text"""
+    url = f"{endpoint}/openai/deployments/{deployment}/embeddings?api-version={version}"
+    payload = {
+        "input": texts
+        # Remove dimensions parameter as it's not supported by this model
+    }
+
+    # The session already sends Content-Type: application/json for the orjson body
+    response = _get_session(key).post(url, data=orjson.dumps(payload))
+    response.raise_for_status()
+    embedding_data = orjson.loads(response.content)
+    # Results carry their input position; keep them aligned with texts
+    data = sorted(embedding_data["data"], key=lambda item: item["index"])
+    embeddings = np.asarray([item["embedding"] for item in data], dtype=np.float32)
+
+    # Normalize once here so cosine similarity downstream is a plain dot product
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings /= norms
+    return embeddings
+
+
+@lru_cache(maxsize=1024)
+def _embed(text: str, endpoint: str, deployment: str, key: str, version: str) -> np.ndarray:
+    """Fetch the embedding for a single text, memoized across plugin instances"""
+    embedding = _request_embeddings([text], endpoint, deployment, key, version)[0]
+    # The same array is handed to every caller, so it must not be mutated
+    embedding.flags.writeable = False
+    return embedding
+
+
+class _SemanticCache:
+    """
+    Answer cache keyed by query meaning rather than exact text.
+
+    A lookup hits when the cosine similarity between the new query embedding
+    and a cached one reaches the threshold, so light rewordings of the same
+    question reuse the earlier answer. Entries only match lookups for the same
+    number of results (top) and query category, since both shape the answer. Entries expire ttl_seconds after they were
+    stored, however often they are hit, and the least recently used entry is
+    replaced once max_entries are stored.
+
+    Embeddings must be unit-length float32 vectors, as returned by
+    generate_embedding. They are stored as rows of one preallocated matrix,
+    so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, threshold: float = 0.86, max_entries: int = 500, ttl_seconds: float = 3600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Allocated on first insert, once the embedding dimension is known
+        self._matrix: Optional[np.ndarray] = None
+        # Insert times drive expiry; last-use times only pick the slot to evict
+        self._inserted = np.full(max_entries, -np.inf)
+        self._last_used = np.full(max_entries, -np.inf)
+        self._tops = np.zeros(max_entries, dtype=np.int64)
+        self._categories = np.full(max_entries, "", dtype=object)
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, embedding: np.ndarray, top: int, category: str) -> Optional[str]:
+        with self._lock:
+            if not self._size:
+                return None
+
+            now = time.monotonic()
+            sims = self._matrix[:self._size] @ embedding
+            sims[now - self._inserted[:self._size] > self.ttl_seconds] = -np.inf
+            sims[self._tops[:self._size] != top] = -np.inf
+            sims[self._categories[:self._size] != category] = -np.inf
+            best = int(sims.argmax())
+            if sims[best] < self.threshold:
+                return None
+
+            self._last_used[best] = now
+            return self._responses[best]
+
+    def put(self, embedding: np.ndarray, top: int, category: str, response: str) -> None:
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.empty((self.max_entries, embedding.shape[0]), dtype=np.float32)
+
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                # Prefer an expired slot, otherwise the least recently used one
+                expired = np.flatnonzero(time.monotonic() - self._inserted > self.ttl_seconds)
+                slot = int(expired[0]) if expired.size else int(self._last_used.argmin())
+
+            self._matrix[slot] = embedding
+            self._tops[slot] = top
+            self._categories[slot] = category
+            self._responses[slot] = response
+            self._inserted[slot] = self._last_used[slot] = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._matrix = None
+            self._inserted.fill(-np.inf)
+            self._categories.fill("")
+            self._last_used.fill(-np.inf)
+            self._responses = [None] * self.max_entries
+            self._size = 0
+
+
+# Shared by every plugin instance, since chat.py creates one per query
+_query_cache = _SemanticCache()
+
+
 class ContosoSearchPlugin:
-    def __init__(self):
-        load_dotenv()
-       
-        self.openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        self.openai_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        self.embedding_deployment = os.getenv("AZURE_OPENAI_EMBED_DEPLOYMENT_NAME")
-        self.embedding_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2023-05-15")
-        # Get embedding endpoint from environment variable
-        self.embedding_endpoint = os.getenv("AZURE_OPENAI_EMBED_ENDPOINT", self.openai_endpoint)
+    def __init__(self, search_client: Optional[SearchClient] = None):
+        self.openai_endpoint = _CFG.openai_endpoint
+        self.openai_api_key = _CFG.openai_api_key
+        self.embedding_deployment = _CFG.embedding_deployment
+        self.embedding_api_version = _CFG.embedding_api_version
+        self.embedding_endpoint = _CFG.embedding_endpoint
        
-        self.search_endpoint = os.getenv("AI_SEARCH_URL")
-        self.search_key = os.getenv("AI_SEARCH_KEY")
-        self.search_index_name = os.getenv("AZURE_SEARCH_INDEX", "employeehandbook")
+        self.search_endpoint = _CFG.search_endpoint
+        self.search_key = _CFG.search_key
+        self.search_index_name = _CFG.search_index_name
        
-        self.search_client = SearchClient(
-            endpoint=self.search_endpoint,
-            index_name=self.search_index_name,
-            credential=AzureKeyCredential(self.search_key)
+        # A client can be passed in to share its connection pool or for tests
+        self.search_client = search_client or _get_search_client(
+            self.search_endpoint,
+            self.search_index_name,
+            self.search_key
         )
         
         # Chat completion endpoint for rephrasing
-        self.chat_endpoint = self.openai_endpoint
-        self.chat_deployment = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
-        self.chat_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2023-12-01-preview")
+        self.chat_endpoint = _CFG.chat_endpoint
+        self.chat_deployment = _CFG.chat_deployment
+        self.chat_api_version = _CFG.chat_api_version
+
+        # Keep-alive connection pool for the embedding and chat endpoints
+        self._session = _get_session(self.openai_api_key)
+
+        # Semantic cache of final answers, looked up by query embedding similarity
+        self._qcache = _query_cache
        
-    def generate_embedding(self, text: str) -> List[float]:
+    def generate_embedding(self, text: str) -> np.ndarray:
+        """Return the unit-length float32 embedding for text; the array is read-only"""
         if not text:
             raise ValueError("Input text cannot be empty")
            
-        url = f"{self.embedding_endpoint}/openai/deployments/{self.embedding_deployment}/embeddings?api-version={self.embedding_api_version}"
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.openai_api_key
-        }
-        payload = {
-            "input": text
-            # Remove dimensions parameter as it's not supported by this model
-        }
-       
         try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            embedding_data = response.json()
-            return embedding_data["data"][0]["embedding"]
+            return _embed(
+                text,
+                self.embedding_endpoint,
+                self.embedding_deployment,
+                self.openai_api_key,
+                self.embedding_api_version
+            )
         except Exception as e:
             raise Exception(f"Failed to generate embedding: {str(e)}")
+
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed many texts, sending them in batches of EMBEDDING_BATCH_SIZE per request"""
+        if not texts or not all(texts):
+            raise ValueError("Input texts cannot be empty")
+
+        try:
+            batches = [
+                _request_embeddings(
+                    texts[start:start + EMBEDDING_BATCH_SIZE],
+                    self.embedding_endpoint,
+                    self.embedding_deployment,
+                    self.openai_api_key,
+                    self.embedding_api_version
+                )
+                for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+            ]
+            return np.vstack(batches)
+        except Exception as e:
+            raise Exception(f"Failed to generate embeddings: {str(e)}")
+
+    def clear_embedding_cache(self) -> None:
+        """Drop all memoized query embeddings"""
+        _embed.cache_clear()
+
+    def clear_query_cache(self) -> None:
+        """Drop all semantically cached handbook answers"""
+        self._qcache.clear()
     
     def rephrase_with_chat_model(self, content: str, query: str) -> str:
         """
         Use the chat model to rephrase and improve the content from search results
         """
+        # If rephrasing fails, return the original content
+        return self._try_rephrase(content, query) or content
+    
+    def _try_rephrase(self, content: str, query: str) -> Optional[str]:
+        """Rephrase content with the chat model, returning None if the call fails or returns nothing"""
         try:
-            url = f"{self.chat_endpoint}/openai/deployments/{self.chat_deployment}/chat/completions?api-version={self.chat_api_version}"
+            rephrased_content = "".join(self.stream_rephrase_with_chat_model(content, query))
+            return rephrased_content.strip() or None
             
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": self.openai_api_key
-            }
-            
-            # Create a prompt to rephrase the content
-            system_prompt = """You are a helpful assistant that rephrases and improves content from an employee handbook. 
-            Your task is to:
-            1. Make the content clear and easy to understand
-            2. Keep all important information intact
-            3. Structure the response in a professional manner
-            4. Focus on answering the specific question asked
-            5. Remove any redundant or unclear text
-            6. Provide a direct, specific answer to the question"""
-            
-            user_prompt = f"""Please rephrase and improve the following content from Contoso's employee handbook to directly answer this specific question: "{query}"
+        except Exception:
+            return None
+    
+    def stream_rephrase_with_chat_model(self, content: str, query: str) -> Iterator[str]:
+        """
+        Stream the rephrased content from the chat model, yielding text as tokens arrive
+        """
+        url = f"{self.chat_endpoint}/openai/deployments/{self.chat_deployment}/chat/completions?api-version={self.chat_api_version}"
+        
+        # Create a prompt to rephrase the content
+        system_prompt = """You are a helpful assistant that rephrases and improves content from an employee handbook. 
+        Your task is to:
+        1. Make the content clear and easy to understand
+        2. Keep all important information intact
+        3. Structure the response in a professional manner
+        4. Focus on answering the specific question asked
+        5. Remove any redundant or unclear text
+        6. Provide a direct, specific answer to the question"""
+        
+        user_prompt = f"""Please rephrase and improve the following content from Contoso's employee handbook to directly answer this specific question: "{query}"
 
 Content from handbook:
 {content}
 
 Please provide a clear, professional, and direct response that specifically answers the question. Do not include generic information that doesn't address the question."""
 
-            payload = {
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.2,  # Lower temperature for more consistent responses
-                "top_p": 0.9
-            }
-            
-            response = requests.post(url, headers=headers, json=payload)
+        payload = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "max_tokens": 400,  # Handbook answers are short; fewer tokens finish sooner
+            "stream": True,
+            "temperature": 0.2,  # Lower temperature for more consistent responses
+            "top_p": 0.9
+        }
+        
+        with self._session.post(url, data=orjson.dumps(payload), stream=True) as response:
             response.raise_for_status()
             
-            result = response.json()
-            rephrased_content = result["choices"][0]["message"]["content"]
+            # Server-sent events: one "data: {json}" line per chunk, ending with "data: [DONE]"
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[len(b"data: "):]
+                if data == b"[DONE]":
+                    break
+                
+                chunk = orjson.loads(data)
+                # Azure sends content filter results in chunks without choices
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+   
+    def search_documents(
+        self,
+        query: str,
+        top: int = 3,
+        precomputed_embedding: Optional[np.ndarray] = None,
+        category: Optional[Category] = None
+    ) -> List[Dict[str, Any]]:
+        # Generate embedding for the query unless the caller already has it
+        query_embedding = precomputed_embedding
+        if query_embedding is None:
+            query_embedding = self.generate_embedding(query)
+       
+        # Create a vectorized query
+        vector_query = VectorizedQuery(
+            vector=query_embedding.tolist(),
+            k_nearest_neighbors=top,
+            fields="contentVector"
+        )
+       
+        # Add search filters based on query type for better targeting
+        if category is None:
+            category = _classify(query)
+        search_filter = category.search_filter
+       
+        try:
+            return self._run_search(query, vector_query, top, search_filter)
+        except Exception as e:
+            if search_filter is None:
+                raise Exception(f"Search failed: {str(e)}")
+        
+        # If filtered search fails, try once without filter
+        try:
+            return self._run_search(query, vector_query, top, None)
+        except Exception as e:
+            raise Exception(f"Search failed: {str(e)}")
+    
+    def _run_search(self, query: str, vector_query: VectorizedQuery, top: int, search_filter: Optional[str]) -> List[Dict[str, Any]]:
+        results = self.search_client.search(
+            search_text=query,  # Also include text search for hybrid retrieval
+            vector_queries=[vector_query],
+            select=SEARCH_RESULT_FIELDS,  # Skip unused fields such as contentVector
+            filter=search_filter,
+            top=top
+        )
+        # Results are fetched lazily, so formatting is where request errors surface
+        return self._format_results(results)
+    
+    def _format_results(self, results) -> List[Dict[str, Any]]:
+        search_results = []
+        for result in results:
+            result_dict = {
+                "score": result["@search.score"]
+            }
             
-            return rephrased_content.strip()
+            # Add all other fields that exist
+            for field in SEARCH_RESULT_FIELDS:
+                if field in result:
+                    result_dict[field] = result[field]
             
-        except Exception as e:
-            # If rephrasing fails, return the original content
-            return content
+            search_results.append(result_dict)
+       
+        return search_results
    
-    def search_documents(self, query: str, top: int = 3) -> List[Dict[str, Any]]:
+    def query_handbook(self, query: str, top: int = 3, rephrase: bool = True, question: Optional[str] = None) -> str:
+        """
+        Answer a handbook query. `question` is the user's original wording when
+        `query` is a condensed search topic; it decides whether a short answer
+        still needs rephrasing, since topics drop words like "how" or "explain".
+        """
         try:
-            # Generate embedding for the query
-            query_embedding = self.generate_embedding(query)
-           
-            # Create a vectorized query
-            vector_query = VectorizedQuery(
-                vector=query_embedding,
-                k_nearest_neighbors=top,
-                fields="contentVector"
-            )
-           
-            # Enhance search with filters for better relevance
-            search_filter = None
-            query_lower = query.lower()
+            # Analyze the query to provide more specific responses
+            category = _classify(query)
+            needs_rephrase = _needs_rephrase(question or query)
+            header = category.response_header or f"**Information from Contoso Employee Handbook regarding '{query}':**\n\n"
             
-            # Add search filters based on query type for better targeting
-            if 'security' in query_lower or 'data' in query_lower:
-                search_filter = "search.ismatch('security OR data OR confidential OR privacy', 'content')"
-            elif 'vacation' in query_lower or 'pto' in query_lower:
-                search_filter = "search.ismatch('vacation OR pto OR leave OR time off', 'content')"
-            elif 'policy' in query_lower:
-                search_filter = "search.ismatch('policy OR guideline OR procedure', 'content')"
-           
-            # Execute the search
-            results = self.search_client.search(
-                search_text=query,  # Also include text search for hybrid retrieval
-                vector_queries=[vector_query],
-                select="*",  # Select all fields
-                filter=search_filter,
-                top=top
+            # Embed once and share it between the semantic cache and the search.
+            # Reworded versions of an already answered question reuse its answer;
+            # the cache holds only the body, so the header reflects this query.
+            query_embedding = self.generate_embedding(query)
+            # Bodies returned without rephrasing are cached under their own key and
+            # are only reused for questions that don't ask for an explanation
+            raw_key = category.name + RAW_ANSWER_SUFFIX
+            cached_body = self._qcache.get(query_embedding, top, category.name)
+            if cached_body is None and not needs_rephrase:
+                cached_body = self._qcache.get(query_embedding, top, raw_key)
+            if cached_body is not None:
+                return header + cached_body
+
+            results = self.search_documents(
+                query, top, precomputed_embedding=query_embedding, category=category
             )
            
-            # Format the results
-            search_results = []
-            for result in results:
-                result_dict = {
-                    "score": result["@search.score"]
-                }
-                
-                # Add all other fields that exist
-                for field in ["chunk_id", "content", "title", "url", "filepath", "parent_id"]:
-                    if field in result:
-                        result_dict[field] = result[field]
-                
-                search_results.append(result_dict)
-           
-            return search_results
-           
-        except Exception as e:
-            # If filtered search fails, try without filter
-            try:
-                results = self.search_client.search(
-                    search_text=query,
-                    vector_queries=[vector_query],
-                    select="*",
-                    top=top
-                )
-                
-                search_results = []
-                for result in results:
-                    result_dict = {
-                        "score": result["@search.score"]
-                    }
-                    
-                    for field in ["chunk_id", "content", "title", "url", "filepath", "parent_id"]:
-                        if field in result:
-                            result_dict[field] = result[field]
-                    
-                    search_results.append(result_dict)
-                
-                return search_results
-            except Exception as e2:
-                raise Exception(f"Search failed: {str(e2)}")
-   
-    def query_handbook(self, query: str, top: int = 3) -> str:
-        try:
-            results = self.search_documents(query, top)
-           
             # Format the results into a nice response
             if not results:
                 return "No relevant information found in the Contoso Handbook."
-           
-            # Analyze the query to provide more specific responses
-            query_lower = query.lower()
-            
-            # Check if it's a specific policy question
-            if any(keyword in query_lower for keyword in ['data security', 'security policy', 'information security']):
-                response = f"**Contoso Data Security Policy Information:**\n\n"
-            elif any(keyword in query_lower for keyword in ['vacation', 'pto', 'time off', 'leave']):
-                response = f"**Contoso Vacation and Time Off Policy:**\n\n"
-            elif any(keyword in query_lower for keyword in ['confidential', 'confidentiality']):
-                response = f"**Contoso Confidentiality Guidelines:**\n\n"
-            elif any(keyword in query_lower for keyword in ['remote work', 'work from home', 'telework']):
-                response = f"**Contoso Remote Work Policy:**\n\n"
-            elif any(keyword in query_lower for keyword in ['benefits', 'health', 'insurance']):
-                response = f"**Contoso Employee Benefits:**\n\n"
-            else:
-                response = f"**Information from Contoso Employee Handbook regarding '{query}':**\n\n"
             
             # Process each result for more specific information
             all_content = []
-            for i, result in enumerate(results, 1):
+            for result in results:
                 content = result.get('content', 'No content available')
                 
                 # Extract key information based on query type
-                if 'data security' in query_lower or 'security policy' in query_lower:
-                    # Look for specific security-related information
-                    security_keywords = ['password', 'encryption', 'access', 'confidential', 'protect', 'secure', 'data handling', 'classification']
-                    relevant_sentences = self.extract_relevant_sentences(content, security_keywords)
-                    if relevant_sentences:
-                        content = relevant_sentences
-                
-                elif 'vacation' in query_lower or 'pto' in query_lower:
-                    # Look for vacation-specific information
-                    vacation_keywords = ['days', 'hours', 'request', 'approval', 'accrual', 'balance', 'holiday']
-                    relevant_sentences = self.extract_relevant_sentences(content, vacation_keywords)
-                    if relevant_sentences:
-                        content = relevant_sentences
+                if category.extract_pattern is not None:
+                    content = self.extract_relevant_sentences(content, category.extract_pattern)
                 
                 all_content.append(content)
             
-            # Combine all content and rephrase using chat model
+            # Combine all content and rephrase using chat model, unless the caller
+            # accepts raw chunks or the chunks already read as a short direct answer
             combined_content = "\n\n".join(all_content)
-            rephrased_content = self.rephrase_with_chat_model(combined_content, query)
+            is_short_answer = (
+                len(combined_content) < FAST_PATH_MAX_CHARS
+                and combined_content.count('.') >= 2
+                and not needs_rephrase
+            )
+            cacheable = rephrase
+            cache_key = raw_key
+            if rephrase and not is_short_answer:
+                rephrased_content = self._try_rephrase(combined_content, query)
+                if rephrased_content is None:
+                    # Fall back to the raw content, but don't keep the degraded answer
+                    rephrased_content = combined_content
+                    cacheable = False
+                else:
+                    cache_key = category.name
+            else:
+                rephrased_content = combined_content
             
-            response += rephrased_content
+            response_parts = [rephrased_content]
             
             # Add source information
-            response += "\n\n**Sources:**\n"
-            for i, result in enumerate(results, 1):
-                if result.get('title'):
-                    response += f"- {result['title']}\n"
-                elif result.get('url'):
-                    response += f"- {result['url']}\n"
-                else:
-                    response += f"- Employee Handbook Section {i}\n"
-           
-            return response
+            response_parts.append("\n\n**Sources:**\n")
+            response_parts.extend(
+                f"- {result.get('title') or result.get('url') or f'Employee Handbook Section {i}'}\n"
+                for i, result in enumerate(results, 1)
+            )
+            body = "".join(response_parts)
+
+            # Answers built with rephrase=False are not cached, so later callers
+            # asking for rephrasing don't get them
+            if cacheable:
+                self._qcache.put(query_embedding, top, cache_key, body)
+            return header + body
            
         except Exception as e:
             return f"Error querying the Contoso Handbook: {str(e)}"
     
-    def extract_relevant_sentences(self, content: str, keywords: List[str]) -> str:
-        """Extract sentences that contain relevant keywords"""
-        sentences = content.split('.')
+    def extract_relevant_sentences(self, content: str, pattern: Pattern[str], limit: int = 3) -> str:
+        """Extract sentences that match the given keyword pattern"""
         relevant_sentences = []
         
-        for sentence in sentences:
+        for sentence in SENTENCE_SPLIT_RE.split(content):
             sentence = sentence.strip()
-            if any(keyword.lower() in sentence.lower() for keyword in keywords):
+            if sentence and pattern.search(sentence):
                 relevant_sentences.append(sentence)
+                if len(relevant_sentences) == limit:  # Limit to the most relevant sentences
+                    break
         
         if relevant_sentences:
-            return '. '.join(relevant_sentences[:3]) + '.'  # Limit to 3 most relevant sentences
+            return ' '.join(relevant_sentences)
         
         return content  # Return original content if no specific matches found
 if __name__ == "__main__":